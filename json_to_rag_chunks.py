@@ -1,7 +1,15 @@
-import ijson
+import orjson
+import simdjson
 import os
 import json
-from typing import Iterator, Dict, Any, List
+import re
+import mmap
+import multiprocessing as mp
+from collections import deque
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit
+from typing import Iterator, Dict, Any, List, Tuple
 
 # Configuration
 INPUT_FILES = ["القوانين.json", "اللوائح.json"]
@@ -9,6 +17,79 @@ OUTPUT_DIR = "processed_docs"
 CHUNK_SIZE = 1500  # Target characters per chunk
 OVERLAP_SIZE = 200  # Overlap characters between chunks
 SEPARATOR = "\n" + "="*40 + "\n"
+NUM_WORKERS = os.cpu_count() or 1  # Processes used to chunk documents in parallel
+DOC_BATCH_SIZE = 64  # Documents sent to a worker per task
+# Inputs at least this large are memory-mapped and parsed lazily with simdjson On-Demand
+# instead of being materialized whole by orjson
+MMAP_THRESHOLD_BYTES = 256 << 20
+LOOKAHEAD = 100  # Max characters a chunk is extended to end on whitespace
+# Article text is chunked through a rolling buffer of about this many characters,
+# so a document's full body is never held in memory at once
+STREAM_BUFFER_CHARS = 64 * CHUNK_SIZE
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB output buffer per chunk file
+# Characters dropped from element ids when building file names. Unicode \w is exactly
+# str.isalnum() plus '_', so Arabic ids are kept as before.
+UNSAFE_FILENAME_RE = re.compile(r'[^\w-]+')
+
+@njit(cache=True)
+def _window_step(chunk_size: int, overlap: int) -> int:
+    """Distance between consecutive window starts."""
+    step = chunk_size - overlap
+    # Ensure we don't get stuck if overlap >= chunk_size (bad config)
+    if step <= 0:
+        step += chunk_size  # Fallback to no overlap to prevent infinite loop
+    if step <= 0:
+        step = max(chunk_size, 1)
+    return step
+
+@njit(cache=True)
+def _window_bounds(arr: np.ndarray, chunk_size: int, overlap: int) -> np.ndarray:
+    """
+    Compute sliding-window (start, end) offsets over a uint32 codepoint buffer.
+    Each window is extended up to LOOKAHEAD characters to end on a space, newline or tab.
+    Operates on integers only, the caller slices the original str with the offsets.
+    """
+    n = arr.size
+    step = _window_step(chunk_size, overlap)
+
+    bounds = np.empty((n // step + 2, 2), dtype=np.int64)
+    count = 0
+    start = 0
+    while start < n:
+        end = min(start + chunk_size, n)
+
+        # Look ahead for a space/newline to avoid cutting words
+        if end < n:
+            limit = min(end + LOOKAHEAD, n)
+            for i in range(end, limit):
+                c = arr[i]
+                if c == 0x20 or c == 0x0A or c == 0x09:
+                    end = i
+                    break
+
+        bounds[count, 0] = start
+        bounds[count, 1] = end
+        count += 1
+
+        # If we reached the end, break
+        if end >= n:
+            break
+
+        # Move start pointer (Sliding Window)
+        start += step
+
+    return bounds[:count]
+
+# Per-process processor, created once by the pool initializer
+_WORKER_PROCESSOR = None
+
+def _init_worker(output_dir: str, chunk_size: int, overlap: int):
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = DocumentProcessor(output_dir, chunk_size, overlap, num_workers=1)
+
+def _render_document_batch(docs: List[Dict[str, Any]]) -> List[Tuple[str, bytes]]:
+    """Worker task: chunk and encode a batch of documents, leaving the writes to the parent."""
+    return [_WORKER_PROCESSOR._render_document(doc) for doc in docs]
 
 class DocumentProcessor:
     """
@@ -16,7 +97,7 @@ class DocumentProcessor:
     suitable for RAG embeddings.
     """
 
-    def __init__(self, output_dir: str, chunk_size: int = 1500, overlap: int = 200):
+    def __init__(self, output_dir: str, chunk_size: int = 1500, overlap: int = 200, num_workers: int = NUM_WORKERS):
         """
         Initialize the processor.
 
@@ -24,17 +105,22 @@ class DocumentProcessor:
             output_dir (str): Directory to save output .txt files.
             chunk_size (int): approximate size of each text chunk in characters.
             overlap (int): number of characters to overlap between chunks.
+            num_workers (int): processes used to chunk documents (1 = process in this process).
         """
         self.output_dir = output_dir
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.num_workers = num_workers
         
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
     def process_json_file(self, file_path: str):
         """
-        Stream process a large JSON file containing a list of documents.
+        Process a JSON file containing a list of documents.
+        Typical files are parsed in one orjson call, which is far faster than streaming
+        them item by item. Files above MMAP_THRESHOLD_BYTES are memory-mapped and parsed
+        with simdjson, whose lazy proxies only decode the fields that are actually read.
         
         Args:
             file_path (str): Path to the JSON file.
@@ -43,22 +129,80 @@ class DocumentProcessor:
         
         try:
             with open(file_path, 'rb') as f:
-                # ijson.items yields complete objects from the array
-                # 'item' refers to each object in the root list
-                documents = ijson.items(f, 'item')
-                
-                count = 0
-                for doc in documents:
-                    self.process_document(doc)
-                    count += 1
-                    if count % 100 == 0:
-                        print(f"Processed {count} documents...", end='\r')
-                
-                print(f"\nFinished processing {count} documents from {file_path}.")
+                if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD_BYTES:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        # The root is a list of document objects
+                        documents = simdjson.Parser().parse(mm)
+                        count = self._process_documents(documents)
+                        del documents
+                else:
+                    # The root is a list of document objects
+                    documents = orjson.loads(f.read())
+                    count = self._process_documents(documents)
+            
+            print(f"\nFinished processing {count} documents from {file_path}.")
                 
         except Exception as e:
             print(f"Error processing {file_path}: {e}")
 
+    def _process_documents(self, documents) -> int:
+        """Process every document of a parsed file, returning the document count."""
+        if self.num_workers > 1:
+            return self._process_parallel(documents)
+
+        count = 0
+        for doc in documents:
+            self.process_document(doc)
+            count += 1
+            if count % 100 == 0:
+                print(f"Processed {count} documents...", end='\r')
+        return count
+
+    def _process_parallel(self, documents) -> int:
+        """
+        Chunk documents across a process pool. Workers return encoded file contents
+        and this process performs every write, so output matches sequential processing.
+        At most 2 batches per worker are in flight, bounding memory for lazily parsed input.
+        """
+        # forkserver avoids forking the parent's full parsed corpus into every worker
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        
+        count = 0
+        pending = deque()
+        with ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=mp.get_context(method),
+            initializer=_init_worker,
+            initargs=(self.output_dir, self.chunk_size, self.overlap)
+        ) as pool:
+            for batch in self._iter_batches(documents):
+                pending.append(pool.submit(_render_document_batch, batch))
+                if len(pending) >= 2 * self.num_workers:
+                    count += self._write_rendered(pending.popleft().result())
+                    print(f"Processed {count} documents...", end='\r')
+            while pending:
+                count += self._write_rendered(pending.popleft().result())
+                print(f"Processed {count} documents...", end='\r')
+        return count
+
+    def _iter_batches(self, documents) -> Iterator[List[Dict[str, Any]]]:
+        """Group documents into picklable DOC_BATCH_SIZE batches."""
+        batch = []
+        for doc in documents:
+            # simdjson proxies cannot cross process boundaries, materialize them per batch
+            batch.append(doc.as_dict() if isinstance(doc, simdjson.Object) else doc)
+            if len(batch) >= DOC_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _write_rendered(self, rendered: List[Tuple[str, bytes]]) -> int:
+        """Write a worker's rendered files, returning how many were written."""
+        for path, content in rendered:
+            self._write_chunks(path, content)
+        return len(rendered)
+
     def process_document(self, doc: Dict[str, Any]):
         """
         Process a single document object, generate chunks, and write to a text file.
@@ -66,19 +210,35 @@ class DocumentProcessor:
         Args:
             doc (Dict): The document dictionary.
         """
+        self._write_chunks(*self._render_document(doc))
+
+    def _render_document(self, doc: Dict[str, Any]) -> Tuple[str, bytes]:
+        """
+        Generate the chunks of a document and encode its output file.
+        
+        Returns:
+            Tuple[str, bytes]: Output file path and its UTF-8 content
+            (empty for metadata-only documents, which get no file).
+        """
         element_id = doc.get("element_id", "unknown")
         
         # 1. Prepare Global Header (Metadata that appears in every chunk)
         header_text = self._create_header(doc)
         
-        # 2. Flatten Articles into a single text stream with their own metadata
-        full_text_content = self._flatten_articles(doc.get("articles", []))
+        articles = doc.get("articles")
+        path = self._chunk_file_path(element_id)
         
+        # Metadata-only documents have nothing to retrieve, skip the header-only stub file
+        # (every article yields a non-blank block, so no articles means no body text)
+        if not articles:
+            return path, b""
+        
+        # 2. Stream Articles as formatted text blocks with their own metadata
         # 3. Generate Chunks (Sliding Window)
-        chunks = self._chunk_text(header_text, full_text_content)
+        chunks = self._chunk_text(header_text, self._iter_article_blocks(articles))
         
-        # 4. Write to file
-        self._write_chunks(element_id, chunks)
+        # 4. Encode file content
+        return path, self._render_chunks(chunks)
 
     def _create_header(self, doc: Dict[str, Any]) -> str:
         """Create the standardized header for the document."""
@@ -93,15 +253,14 @@ class DocumentProcessor:
         header += "-" * 20 + "\n"
         return header
 
-    def _flatten_articles(self, articles: List[Dict[str, Any]]) -> str:
+    def _iter_article_blocks(self, articles: List[Dict[str, Any]]) -> Iterator[str]:
         """
-        Convert list of articles into a single formatted string.
+        Yield each article as a formatted text block.
         Handles canceled articles and dates.
         """
         if not articles:
-            return ""
+            return
 
-        text_parts = []
         for art in articles:
             title = art.get("article_title", "")
             
@@ -139,68 +298,77 @@ class DocumentProcessor:
             article_block = f"\n[{title} ({status}) - {date_info}]\n"
             article_block += f"{content_text}\n"
             
-            text_parts.append(article_block)
-            
-        return "".join(text_parts)
+            yield article_block
 
-    def _chunk_text(self, header: str, body: str) -> List[str]:
+    def _chunk_text(self, header: str, blocks: Iterator[str]) -> List[str]:
         """
-        Split body text into overlapping windows and prepend header to each.
+        Split the body text streamed as blocks into overlapping windows and prepend header to each.
+        
+        Blocks are pulled into a rolling buffer. Each round emits only the windows whose
+        end (including whitespace lookahead) lies inside the buffer, then drops the text
+        before the next window start, so windows are identical to chunking the joined body.
         """
         chunks = []
-        body_len = len(body)
+        blocks = iter(blocks)
+        step = _window_step(self.chunk_size, self.overlap)
+        window_span = self.chunk_size + LOOKAHEAD
+        refill_chars = max(STREAM_BUFFER_CHARS, 2 * window_span)
         
-        if body_len == 0:
-            # Even if empty body, we might want one chunk with just metadata? 
-            # Or skip. Let's return one chunk with header.
-            return [header.strip()]
-
-        start = 0
-        while start < body_len:
-            end = min(start + self.chunk_size, body_len)
+        buffer = ""
+        exhausted = False
+        while True:
+            # Pull blocks until a full round of windows fits (or the stream ends)
+            parts = [buffer]
+            length = len(buffer)
+            while not exhausted and length < refill_chars:
+                block = next(blocks, None)
+                if block is None:
+                    exhausted = True
+                else:
+                    parts.append(block)
+                    length += len(block)
+            buffer = "".join(parts)
             
-            # Refinement: Try not to split words?
-            # Find the nearest space after chunk_size IF we are not at end
-            if end < body_len:
-                # Look ahead for a space/newline to avoid cutting words
-                # Limit lookahead to avoid extending chunk too much (e.g. 100 chars)
-                next_space = -1
-                for i in range(0, 100):
-                    if end + i < body_len and body[end+i] in [' ', '\n', '\t']:
-                        next_space = end + i
-                        break
-                if next_space != -1:
-                    end = next_space
-
-            chunk_content = body[start:end]
-            full_chunk = header + chunk_content
-            chunks.append(full_chunk)
+            if not buffer:
+                break
+            
+            # The window search runs jitted over codepoints; UTF-32 offsets equal str offsets
+            arr = np.frombuffer(buffer.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+            bounds = _window_bounds(arr, self.chunk_size, self.overlap)
             
-            # Optimization: If we reached the end, break
-            if end >= body_len:
+            if exhausted:
+                chunks.extend(header + buffer[start:end] for start, end in bounds.tolist())
                 break
-                
-            # Move start pointer (Sliding Window)
-            start += (self.chunk_size - self.overlap)
             
-            # Ensure we don't get stuck if overlap >= chunk_size (bad config)
-            if (self.chunk_size - self.overlap) <= 0:
-                start += self.chunk_size  # Fallback to no overlap to prevent infinite loop
-                
+            # Windows reaching near the buffer end may still grow into the next block
+            complete = bounds[bounds[:, 0] + window_span <= len(buffer)].tolist()
+            chunks.extend(header + buffer[start:end] for start, end in complete)
+            buffer = buffer[complete[-1][0] + step:]
+        
+        if not chunks:
+            # Even if empty body, we might want one chunk with just metadata? 
+            # Or skip. Let's return one chunk with header.
+            return [header.strip()]
+        
         return chunks
 
-    def _write_chunks(self, element_id: str, chunks: List[str]):
-        """Write formattted chunks to a file."""
+    def _chunk_file_path(self, element_id: str) -> str:
+        """Output path for a document's chunk file."""
         # Sanitize filename
-        safe_id = "".join(c for c in str(element_id) if c.isalnum() or c in ('-', '_'))
+        safe_id = UNSAFE_FILENAME_RE.sub('', str(element_id))
         filename = f"{safe_id}.txt"
-        path = os.path.join(self.output_dir, filename)
-        
-        with open(path, 'w', encoding='utf-8') as f:
-            for i, chunk in enumerate(chunks):
-                f.write(f"--- CHUNK {i+1} ---\n")
-                f.write(chunk)
-                f.write("\n\n")
+        return os.path.join(self.output_dir, filename)
+
+    def _render_chunks(self, chunks: List[str]) -> bytes:
+        """Format chunks into the file layout, encoded once as UTF-8."""
+        return "".join(f"--- CHUNK {i+1} ---\n{chunk}\n\n" for i, chunk in enumerate(chunks)).encode('utf-8')
+
+    def _write_chunks(self, path: str, content: bytes):
+        """Write formattted chunks to a file with a single binary write."""
+        if not content:
+            return
+        with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(content)
 
 def main():
     processor = DocumentProcessor(
@@ -0,0 +1,5 @@
+# Payload layout shared by ingestion (create_vector_db.py) and retrieval (retrieval_pipeline.py).
+# Kept free of heavy imports so both sides can load it cheaply.
+
+# Payload fields indexed as keywords so filters on them are evaluated inside HNSW traversal
+KEYWORD_INDEX_FIELDS = ["doc_id", "source_file"]